@@ -1,5 +1,34 @@
 import deuces
 
+import itertools
+import marshal
+import os
+from collections import Counter, defaultdict
+
+def _rank_distribution(counts):
+    '''Turns hand counts indexed by rank into (pdf, cdf) lists over the same
+    index, where cdf[hr] is the fraction of hands ranking hr or better.'''
+    total = float(sum(counts))
+    pdf, cdf = [], []
+    running = 0
+    for count in counts:
+        running += count
+        pdf.append(count / total)
+        cdf.append(running / total)
+    return pdf, cdf
+
+def _five_card_counts(max_to_degeneracy):
+    counts = [0]
+    for max_rank in sorted(max_to_degeneracy):
+        counts.extend([max_to_degeneracy[max_rank]] * (max_rank + 1 - len(counts)))
+    return counts
+
+def _prime_product(primes):
+    product = 1
+    for p in primes:
+        product *= p
+    return product
+
 class DistLookupTable(deuces.lookup.LookupTable):
     '''
         Deuces ranks each set of 5 cards, by making the most of the fact that there 
@@ -29,9 +58,162 @@ class DistLookupTable(deuces.lookup.LookupTable):
         also a cumulative distribution function. 
 
         This function returns the normalised distribution function for a rank. 
+
+        Building the lookup dicts is done in Python on every construction, so the
+        built table is snapshotted to disk (marshal) on first use and reloaded 
+        from there afterwards. Set MONTY_DEUCES_SNAPSHOT to move the snapshot, or
+        to an empty string to always build from scratch. The much larger seven 
+        card tables are only built, or loaded from a snapshot of their own next 
+        to it, the first time something asks for them.
+
+        The larger precomputed arrays can also be published once per host into 
+        shared memory (see shared_tables.py) and attached to by name, so pooled 
+        bots hold one copy between them. A table attaches when a shared_name is 
+        given or MONTY_SHARED_TABLES is set in the environment. The five card 
+        dicts stay per process: they are small, and evaluate() needs dict speed.
         '''
-    def __init__(self):
-        super(DistLookupTable, self).__init__()
+    SNAPSHOT_VERSION = 3
+    SNAPSHOT_PATH = os.environ.get("MONTY_DEUCES_SNAPSHOT", os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "deuces_lookup.snapshot"))
+
+    def __init__(self, snapshot_path=None, shared_name=None):
+        if shared_name is None:
+            shared_name = os.environ.get("MONTY_SHARED_TABLES")
+        self.shared_arrays = None
+        self.unsuited7_lookup = self.flush7_lookup = None
+        self.seven_card_counts = self.seven_card_pdf = self.seven_card_cdf = None
+
+        path = self.SNAPSHOT_PATH if snapshot_path is None else snapshot_path
+        self.snapshot_path = path
+        if not (path and self.load_snapshot(path)):
+            super(DistLookupTable, self).__init__()
+            if path:
+                self.save_snapshot(path)
+
+        if shared_name:
+            self.attach(shared_name)
+
+    @staticmethod
+    def seven_card_snapshot_path(path):
+        root, ext = os.path.splitext(path)
+        return root + "7" + ext
+
+    def load_seven_card_tables(self):
+        '''Makes sure the seven card tables are there, loading them from their
+        snapshot or building them (a couple of seconds) on first use.'''
+        if self.seven_card_counts is not None:
+            return
+        path = self.snapshot_path and self.seven_card_snapshot_path(self.snapshot_path)
+        if not (path and self.load_seven_card_snapshot(path)):
+            self.build_seven_card_tables()
+            if path:
+                self.save_seven_card_snapshot(path)
+
+    def load_snapshot(self, path):
+        '''Fills the lookup dicts from a snapshot, returns False if there is 
+        no usable snapshot at path.'''
+        try:
+            self.flush_lookup, self.unsuited_lookup = self._read_snapshot(path)
+        except (TypeError, ValueError):
+            return False
+        return True
+
+    def load_seven_card_snapshot(self, path):
+        try:
+            (self.unsuited7_lookup, self.flush7_lookup, 
+                seven_card_counts) = self._read_snapshot(path)
+        except (TypeError, ValueError):
+            return False
+        self.set_seven_card_counts(seven_card_counts)
+        return True
+
+    def save_snapshot(self, path):
+        self._write_snapshot(path, (self.flush_lookup, self.unsuited_lookup))
+
+    def save_seven_card_snapshot(self, path):
+        self._write_snapshot(path, (self.unsuited7_lookup, self.flush7_lookup, 
+                                    self.seven_card_counts))
+
+    def _read_snapshot(self, path):
+        '''The fields of the snapshot at path, None if it is missing, 
+        unreadable or from another SNAPSHOT_VERSION.'''
+        try:
+            with open(path, "rb") as f:
+                snapshot = marshal.load(f)
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            return None
+        if not isinstance(snapshot, tuple) or snapshot[:1] != (self.SNAPSHOT_VERSION,):
+            return None
+        return snapshot[1:]
+
+    def _write_snapshot(self, path, fields):
+        '''Best effort: a bot that cannot write the snapshot still plays.'''
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        try:
+            with open(tmp_path, "wb") as f:
+                marshal.dump((self.SNAPSHOT_VERSION,) + fields, f)
+            os.rename(tmp_path, path)
+        except (IOError, OSError):
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def to_arrays(self):
+        '''The lookup tables as numpy arrays, ready for shared_tables.'''
+        import shared_tables
+        np = shared_tables.np
+        self.load_seven_card_tables()
+        flush_keys, flush_ranks = shared_tables.SharedRankLookup.arrays_from_dict(
+                self.flush_lookup)
+        unsuited_keys, unsuited_ranks = shared_tables.SharedRankLookup.arrays_from_dict(
+                self.unsuited_lookup)
+        unsuited7_keys, unsuited7_ranks = shared_tables.SharedRankLookup.arrays_from_dict(
+                self.unsuited7_lookup)
+        return {
+            "flush_keys": flush_keys,
+            "flush_ranks": flush_ranks,
+            "unsuited_keys": unsuited_keys,
+            "unsuited_ranks": unsuited_ranks,
+            "unsuited7_keys": unsuited7_keys,
+            "unsuited7_ranks": unsuited7_ranks,
+            "flush7_ranks": np.array(self.flush7_lookup, dtype=np.uint16),
+            "seven_card_counts": np.array(self.seven_card_counts, dtype=np.int64),
+            "seven_card_pdf": np.array(self.seven_card_pdf),
+            "seven_card_cdf": np.array(self.seven_card_cdf)
+        }
+
+    def publish(self, name, extra_arrays=None, overwrite=False):
+        '''Publishes the rank tables, plus any other precomputed arrays, as the
+        shared table set `name`. Returns the path of the set.'''
+        import shared_tables
+        arrays = self.to_arrays()
+        arrays.update(extra_arrays or {})
+        return shared_tables.publish(name, arrays, overwrite=overwrite)
+
+    SHARED_ARRAYS = ("flush_keys", "flush_ranks", "unsuited_keys", "unsuited_ranks",
+                     "unsuited7_keys", "unsuited7_ranks", "flush7_ranks", 
+                     "seven_card_counts", "seven_card_pdf", "seven_card_cdf")
+
+    def attach(self, name):
+        '''Swaps the seven card tables for read-only views of the shared table
+        set `name`, whose arrays are also what BatchEvaluator works from. 
+        Returns False, leaving the table untouched, if it isn't there.'''
+        import shared_tables
+        try:
+            arrays = shared_tables.attach(name)
+        except IOError:
+            return False
+        if any(key not in arrays for key in self.SHARED_ARRAYS):
+            return False
+        self.unsuited7_lookup = shared_tables.SharedRankLookup(
+                arrays["unsuited7_keys"], arrays["unsuited7_ranks"])
+        self.flush7_lookup = arrays["flush7_ranks"]
+        self.seven_card_counts = arrays["seven_card_counts"]
+        self.seven_card_pdf = arrays["seven_card_pdf"]
+        self.seven_card_cdf = arrays["seven_card_cdf"]
+        self.shared_arrays = arrays
+        return True
     
     MAX_STRAIGHT_FLUSH  = 10
     MAX_FOUR_OF_A_KIND  = 166
@@ -80,67 +262,124 @@ class DistLookupTable(deuces.lookup.LookupTable):
         }
 
     MAX_ALL_HANDS = 2598960
+    MAX_ALL_SEVEN_CARD_HANDS = 133784560
+
+    # FIVE_CARD_PDF[hr]: probability a random 5 card hand has rank hr
+    # FIVE_CARD_CDF[hr]: probability it ranks hr or better
+    FIVE_CARD_PDF, FIVE_CARD_CDF = _rank_distribution(_five_card_counts(MAX_TO_DEGENERACY))
+
+    def build_seven_card_tables(self):
+        '''
+        Counts the best 5 card rank of all 133,784,560 seven card hands, without 
+        evaluating each of them. Ignoring flushes, the best hand only depends on 
+        the 7 ranks, and there are only 49,205 rank multisets, each weighted by 
+        its number of suit assignments. Hands with 5+ cards of one suit are 
+        counted separately, by enumerating the suited ranks and the ranks of the 
+        remaining cards in the other three suits, and removed from the weights.
+
+        Along the way this leaves two tables which evaluate any 7 card hand in 
+        a couple of lookups: 
+            unsuited7_lookup - prime product of the 7 ranks => best non flush rank
+            flush7_lookup    - 13 bit mask of 5-7 suited ranks => best flush rank
+        '''
+        primes = deuces.Card.PRIMES
+        no_flush = self.MAX_HIGH_CARD + 1
+
+        flush7 = [no_flush] * (1 << 13)
+        for size in (5, 6, 7):
+            for ranks in itertools.combinations(range(13), size):
+                mask = sum(1 << r for r in ranks)
+                flush7[mask] = min(
+                    self.flush_lookup[_prime_product(primes[r] for r in five)]
+                    for five in itertools.combinations(ranks, 5))
+
+        unsuited7 = {}
+        suitings = {}
+        for ranks in itertools.combinations_with_replacement(range(13), 7):
+            multiplicity = Counter(ranks)
+            if max(multiplicity.values()) > 4:
+                continue
+            rank_primes = [primes[r] for r in ranks]
+            prime = _prime_product(rank_primes)
+            unsuited7[prime] = min(
+                self.unsuited_lookup[_prime_product(five)]
+                for five in itertools.combinations(rank_primes, 5))
+            suitings[prime] = _prime_product(
+                self.SUITINGS_OF_4[n] for n in multiplicity.values())
+
+        counts = [0] * (no_flush)
+        flush_suitings = defaultdict(int)
+        for size in (5, 6, 7):
+            for ranks in itertools.combinations(range(13), size):
+                mask = sum(1 << r for r in ranks)
+                suited_prime = _prime_product(primes[r] for r in ranks)
+                for others in itertools.combinations_with_replacement(range(13), 7 - size):
+                    prime = suited_prime * _prime_product(primes[r] for r in others)
+                    # 4 choices of flush suit, the rest come from the other 3 suits
+                    ways = 4 * _prime_product(
+                        self.SUITINGS_OF_3[n] for n in Counter(others).values())
+                    counts[min(flush7[mask], unsuited7[prime])] += ways
+                    flush_suitings[prime] += ways
+
+        for prime, ways in suitings.items():
+            counts[unsuited7[prime]] += ways - flush_suitings[prime]
+
+        self.unsuited7_lookup = unsuited7
+        self.flush7_lookup = flush7
+        self.set_seven_card_counts(counts)
+
+    # ways to pick suits for n cards of one rank, from 4 or from 3 suits
+    SUITINGS_OF_4 = [1, 4, 6, 4, 1]
+    SUITINGS_OF_3 = [1, 3, 3, 1]
+
+    def set_seven_card_counts(self, counts):
+        self.seven_card_counts = counts
+        self.seven_card_pdf, self.seven_card_cdf = _rank_distribution(counts)
 
 class DistributionsEvaluator(deuces.evaluator.Evaluator):
-    def __init__(self):
-        super(DistributionsEvaluator, self).__init__()
-        self.table = DistLookupTable()
+    def __init__(self, shared_name=None):
+        # deliberately not calling Evaluator.__init__, which would build a second, 
+        # plain LookupTable from scratch only for it to be replaced below
+        self.table = DistLookupTable(shared_name=shared_name)
+        self.hand_size_map = {
+            5 : self._five,
+            6 : self._six,
+            7 : self._seven
+        }
 
     def get_five_card_rank_probability_distribution(self, hr):
-        class_degeneracy = DistLookupTable.RANK_CLASS_TO_DEGENERACY[self.get_rank_class(hr)]
-        return float(class_degeneracy)/float(DistLookupTable.MAX_HANDS)
-        
+        """
+        Probability of a random 5 card hand having exactly the hand rank hr.
+        """
+        return DistLookupTable.FIVE_CARD_PDF[self._check_rank(hr)]
+
     def get_five_card_rank_percentile(self, hr):
         """
-        Returns the class of hand given the hand hand_rank
-        returned from evaluate. 
+        Fraction of all 5 card hands that rank hr or better.
         """
-        if hr >= 0 and hr <= DistLookupTable.MAX_STRAIGHT_FLUSH:
-            lower_hds_in_rc = (hr - 0) * DistLookupTable.MAX_TO_DEGENERACY[DistLookupTable.MAX_STRAIGHT_FLUSH]            
-            lower_hds_not_in_rc = 0
-            return float(lower_hds_in_rc + lower_hds_not_in_rc)/float(DistLookupTable.MAX_ALL_HANDS) 
-        
-        elif hr <= DistLookupTable.MAX_FOUR_OF_A_KIND:
-            lower_hds_in_rc = (hr - DistLookupTable.MAX_STRAIGHT_FLUSH) * DistLookupTable.MAX_TO_DEGENERACY[DistLookupTable.MAX_FOUR_OF_A_KIND]            
-            lower_hds_not_in_rc = DistLookupTable.MAX_TO_PERCENTILE[DistLookupTable.MAX_FOUR_OF_A_KIND]
-            return float(lower_hds_in_rc + lower_hds_not_in_rc)/float(DistLookupTable.MAX_ALL_HANDS)  
-        
-        elif hr <= DistLookupTable.MAX_FULL_HOUSE:
-            lower_hds_in_rc = (hr - DistLookupTable.MAX_FOUR_OF_A_KIND) * DistLookupTable.MAX_TO_DEGENERACY[DistLookupTable.MAX_FULL_HOUSE]            
-            lower_hds_not_in_rc = DistLookupTable.MAX_TO_PERCENTILE[DistLookupTable.MAX_FULL_HOUSE]
-            return float(lower_hds_in_rc + lower_hds_not_in_rc)/float(DistLookupTable.MAX_ALL_HANDS)  
-        
-        elif hr <= DistLookupTable.MAX_FLUSH:
-            lower_hds_in_rc = (hr - DistLookupTable.MAX_FULL_HOUSE) * DistLookupTable.MAX_TO_DEGENERACY[DistLookupTable.MAX_FLUSH]            
-            lower_hds_not_in_rc = DistLookupTable.MAX_TO_PERCENTILE[DistLookupTable.MAX_FLUSH]
-            return float(lower_hds_in_rc + lower_hds_not_in_rc)/float(DistLookupTable.MAX_ALL_HANDS)  
-        
-        elif hr <= DistLookupTable.MAX_STRAIGHT:
-            lower_hds_in_rc = (hr - DistLookupTable.MAX_FLUSH) * DistLookupTable.MAX_TO_DEGENERACY[DistLookupTable.MAX_STRAIGHT]            
-            lower_hds_not_in_rc = DistLookupTable.MAX_TO_PERCENTILE[DistLookupTable.MAX_STRAIGHT]
-            return float(lower_hds_in_rc + lower_hds_not_in_rc)/float(DistLookupTable.MAX_ALL_HANDS)  
-        
-        elif hr <= DistLookupTable.MAX_THREE_OF_A_KIND:
-            lower_hds_in_rc = (hr - DistLookupTable.MAX_STRAIGHT) * DistLookupTable.MAX_TO_DEGENERACY[DistLookupTable.MAX_THREE_OF_A_KIND]            
-            lower_hds_not_in_rc = DistLookupTable.MAX_TO_PERCENTILE[DistLookupTable.MAX_THREE_OF_A_KIND]
-            return float(lower_hds_in_rc + lower_hds_not_in_rc)/float(DistLookupTable.MAX_ALL_HANDS)  
-        
-        elif hr <= DistLookupTable.MAX_TWO_PAIR:
-            lower_hds_in_rc = (hr - DistLookupTable.MAX_THREE_OF_A_KIND) * DistLookupTable.MAX_TO_DEGENERACY[DistLookupTable.MAX_TWO_PAIR]            
-            lower_hds_not_in_rc = DistLookupTable.MAX_TO_PERCENTILE[DistLookupTable.MAX_TWO_PAIR]
-            return float(lower_hds_in_rc + lower_hds_not_in_rc)/float(DistLookupTable.MAX_ALL_HANDS)  
-        
-        elif hr <= DistLookupTable.MAX_PAIR:
-            lower_hds_in_rc = (hr - DistLookupTable.MAX_TWO_PAIR) * DistLookupTable.MAX_TO_DEGENERACY[DistLookupTable.MAX_PAIR]            
-            lower_hds_not_in_rc = DistLookupTable.MAX_TO_PERCENTILE[DistLookupTable.MAX_PAIR]
-            return float(lower_hds_in_rc + lower_hds_not_in_rc)/float(DistLookupTable.MAX_ALL_HANDS)  
-        
-        elif hr <= DistLookupTable.MAX_HIGH_CARD:
-            lower_hds_in_rc = (hr - DistLookupTable.MAX_PAIR) * DistLookupTable.MAX_TO_DEGENERACY[DistLookupTable.MAX_HIGH_CARD]            
-            lower_hds_not_in_rc = DistLookupTable.MAX_TO_PERCENTILE[DistLookupTable.MAX_HIGH_CARD]
-            return float(lower_hds_in_rc + lower_hds_not_in_rc)/float(DistLookupTable.MAX_ALL_HANDS)  
-        else:
+        return DistLookupTable.FIVE_CARD_CDF[self._check_rank(hr)]
+
+    def get_seven_card_rank_probability_distribution(self, hr):
+        """
+        Probability of a random 7 card hand having hr as its best 5 card rank.
+        """
+        self.table.load_seven_card_tables()
+        return self.table.seven_card_pdf[self._check_rank(hr)]
+
+    def get_seven_card_rank_percentile(self, hr):
+        """
+        Fraction of all 7 card hands whose best 5 cards rank hr or better. 
+        This is what to compare a hand from evaluate(cards, board) against 
+        once the board is complete.
+        """
+        self.table.load_seven_card_tables()
+        return self.table.seven_card_cdf[self._check_rank(hr)]
+
+    @staticmethod
+    def _check_rank(hr):
+        if hr < 0 or hr > DistLookupTable.MAX_HIGH_CARD:
             raise Exception("Invalid hand rank, cannot return rank class")
+        return hr
 
 deuces.Evaluator = DistributionsEvaluator
 
@@ -0,0 +1,325 @@
+'''Batched equity calculations for the bots.
+
+BadOddsBot's monte_carlo_expected_winnings evaluates one hand at a time
+through deuces. The functions here ask the same DistributionsEvaluator
+tables for whole arrays of hands at once: every 7 card hand is one
+lookup of its rank prime product (unsuited7) and one per suit of its
+suited rank bits (flush7), see DistLookupTable.build_seven_card_tables.
+
+Ranks follow deuces, lower is better.
+'''
+from adjusted_deuces import deuces as dc
+import shared_tables
+
+import numpy as np
+import random
+from collections import namedtuple
+from itertools import combinations
+
+SUITS = (1, 2, 4, 8)
+
+
+class BatchEvaluator(object):
+    '''Numpy front end to a DistributionsEvaluator's lookup tables.'''
+
+    def __init__(self, evaluator):
+        table = evaluator.table
+        arrays = table.shared_arrays
+        if arrays is None:
+            arrays = table.to_arrays()
+        self.flush = shared_tables.SharedRankLookup(
+            arrays["flush_keys"], arrays["flush_ranks"])
+        self.unsuited = shared_tables.SharedRankLookup(
+            arrays["unsuited_keys"], arrays["unsuited_ranks"])
+        self.unsuited7 = shared_tables.SharedRankLookup(
+            arrays["unsuited7_keys"], arrays["unsuited7_ranks"])
+        self.flush7 = arrays["flush7_ranks"]
+
+    @staticmethod
+    def features(hands):
+        '''Prime products and per suit rank bits, shapes (N,) and (N, 4), of
+        an (N, k) array of deuces card ints.'''
+        hands = np.asarray(hands, dtype=np.int64).reshape(len(hands), -1)
+        primes = np.prod(hands & 0xFF, axis=1)
+        suits = (hands >> 12) & 0xF
+        rank_bits = (hands >> 16) & 0x1FFF
+        bits = np.stack([np.bitwise_or.reduce(np.where(suits == s, rank_bits, 0), axis=1)
+                         for s in SUITS], axis=1)
+        return primes, bits
+
+    def rank_matrix(self, boards, holdings):
+        '''Ranks of every holding on every board, shape (len(boards),
+        len(holdings)), for boards and holdings that add up to 7 cards.
+
+        Pairs that share a card get a meaningless rank, mask them out.'''
+        board_primes, board_bits = self.features(boards)
+        hold_primes, hold_bits = self.features(holdings)
+
+        ranks = self.unsuited7.lookup_many(board_primes[:, None] * hold_primes[None, :])
+        for s in xrange(len(SUITS)):
+            suited = board_bits[:, s, None] | hold_bits[None, :, s]
+            ranks = np.minimum(ranks, self.flush7[suited])
+        return ranks
+
+    def rank_many(self, hands):
+        '''Ranks of an (N, k) array of 5 to 7 card hands, best 5 of each.'''
+        hands = np.asarray(hands, dtype=np.int64)
+        if hands.shape[1] == 7:
+            return self.rank_matrix(hands, np.zeros((1, 0), dtype=np.int64))[:, 0]
+
+        best = None
+        for five in combinations(xrange(hands.shape[1]), 5):
+            cards = hands[:, five]
+            primes = np.prod(cards & 0xFF, axis=1)
+            is_flush = np.bitwise_and.reduce(cards, axis=1) & 0xF000
+            ranks = np.where(is_flush, self.flush.lookup_many(primes),
+                             self.unsuited.lookup_many(primes))
+            best = ranks if best is None else np.minimum(best, ranks)
+        return best
+
+
+def batch_evaluator(evaluator):
+    '''The BatchEvaluator for evaluator, built on first use and kept on it.'''
+    batch = getattr(evaluator, "_batch_evaluator", None)
+    if batch is None:
+        batch = evaluator._batch_evaluator = BatchEvaluator(evaluator)
+    return batch
+
+
+def _deck_masks(card_indices):
+    '''Bitmask over deck positions for each row of card indices.'''
+    masks = np.zeros(len(card_indices), dtype=np.uint64)
+    for column in np.asarray(card_indices, dtype=np.uint64).reshape(len(card_indices), -1).T:
+        masks |= np.left_shift(np.uint64(1), column)
+    return masks
+
+
+HandStrength = namedtuple("HandStrength", [
+    "hs",         # equity vs one random hand on the current board
+    "ehs",        # expected equity at showdown over all runouts
+    "ehs2",       # expected squared equity, rewards hands whose equity spreads out
+    "ppot",       # P(behind or tied now, ahead at showdown)
+    "npot",       # P(ahead or tied now, behind at showdown)
+    "histogram",  # fraction of runouts whose showdown equity falls in each bin
+])
+
+
+def hand_strength_distribution(cards, board, evaluator, bins=10):
+    '''Distribution of our showdown equity against one uniformly random
+    opponent hand, over every runout of the board (flop, turn or river).
+
+    Where monte_carlo_expected_winnings collapses this to one number, the
+    histogram, EHS^2 and positive/negative potential tell a made hand from a
+    draw of the same equity. Potentials follow Billings et al.'s HandPotential,
+    with ties counting half.
+    '''
+    if not cards or not board:
+        return None
+    batch = batch_evaluator(evaluator)
+
+    deck = np.array(sorted(set(dc.Deck.GetFullDeck()) - set(cards + board)), dtype=np.int64)
+    hold_idx = np.array(list(combinations(xrange(len(deck)), 2)), dtype=np.int64)
+    runouts = list(combinations(xrange(len(deck)), 5 - len(board)))
+    runout_idx = np.array(runouts, dtype=np.int64).reshape(len(runouts), 5 - len(board))
+
+    holdings = deck[hold_idx]
+    boards = np.hstack([np.tile(board, (len(runout_idx), 1)), deck[runout_idx]])
+    valid = (_deck_masks(runout_idx)[:, None] & _deck_masks(hold_idx)[None, :]) == 0
+
+    ours = batch.rank_matrix(boards, np.array([cards]))
+    theirs = batch.rank_matrix(boards, holdings)
+    final = np.sign(theirs.astype(np.int32) - ours.astype(np.int32))  # 1 ahead, 0 tie, -1 behind
+
+    our_now = evaluator.evaluate(cards, board)
+    their_now = batch.rank_many(np.hstack([holdings, np.tile(board, (len(holdings), 1))]))
+    now = np.sign(their_now.astype(np.int32) - our_now)
+
+    # equity of each runout against the holdings still possible on it
+    valid_count = valid.sum(axis=1)
+    equity = (np.where(valid, final + 1, 0).sum(axis=1) / 2.0) / valid_count
+    histogram = np.histogram(equity, bins=bins, range=(0.0, 1.0))[0] / float(len(equity))
+
+    # hp[i, j]: (holding, runout) pairs in state i now and state j at showdown
+    hp = np.zeros((3, 3))
+    for i in xrange(3):
+        in_state = valid & (now == i - 1)[None, :]
+        hp[i] = np.bincount((final[in_state] + 1).ravel(), minlength=3)
+    behind, tied, ahead = 0, 1, 2
+    totals = hp.sum(axis=1)
+
+    ppot_den = totals[behind] + totals[tied] / 2.0
+    npot_den = totals[ahead] + totals[tied] / 2.0
+    ppot = (hp[behind, ahead] + hp[behind, tied] / 2.0 + hp[tied, ahead] / 2.0) / ppot_den \
+        if ppot_den else 0.0
+    npot = (hp[ahead, behind] + hp[tied, behind] / 2.0 + hp[ahead, tied] / 2.0) / npot_den \
+        if npot_den else 0.0
+
+    return HandStrength(
+        hs=float(np.mean((now + 1) / 2.0)),
+        ehs=float(equity.mean()),
+        ehs2=float((equity ** 2).mean()),
+        ppot=float(ppot),
+        npot=float(npot),
+        histogram=histogram)
+
+
+class EquitySampler(object):
+    '''Picks the opponent holdings that BadOddsBot.monte_carlo_sample
+    evaluates, from its own RNG rather than the global one.
+
+    A seed makes every estimate reproducible, and spawn(i) hands out
+    independent streams of the same seed (one per bot, per thread, ...).
+    Beyond plain random sampling there are variance reducing modes. They pay
+    off when the population is sorted by something correlated with the
+    outcome, monte_carlo_expected_winnings sorts holdings by their strength
+    on the current board:
+
+        stratified - split the population into k equal strata, draw one
+                     holding uniformly from each
+        antithetic - draw half the holdings, mirror each one to the other
+                     end of the population for the other half
+        quasi      - systematic sample whose offset follows a golden ratio
+                     (low discrepancy) sequence, so successive runouts
+                     cover the strata evenly rather than by chance
+    '''
+    MODES = ("random", "stratified", "antithetic", "quasi")
+    GOLDEN_RATIO = (5 ** 0.5 - 1) / 2
+
+    def __init__(self, seed=None, mode="random", stream=0):
+        if mode not in self.MODES:
+            raise ValueError("Unknown sampling mode %r, expected one of: %s" % (
+                mode, ", ".join(self.MODES)))
+        self.seed = seed
+        self.mode = mode
+        self.stream = stream
+        self.rng = random.Random(None if seed is None else seed * 1000003 + stream)
+        self._quasi_offset = self.rng.random()
+
+    def spawn(self, stream):
+        '''An independent sampler with the same seed and mode.'''
+        return EquitySampler(self.seed, self.mode, stream)
+
+    def sample(self, population, k):
+        '''k distinct items of the population sequence.'''
+        n = len(population)
+        if k > n:
+            raise ValueError("Sample larger than population")
+
+        if self.mode == "random":
+            return self.rng.sample(population, k)
+
+        elif self.mode == "stratified":
+            picks = []
+            for i in xrange(k):
+                lo, hi = i * n // k, (i + 1) * n // k
+                picks.append(population[lo + int(self.rng.random() * (hi - lo))])
+            return picks
+
+        elif self.mode == "antithetic":
+            half = self.rng.sample(xrange(n), (k + 1) // 2)
+            chosen = set(half)
+            for i in half:
+                if len(chosen) == k:
+                    break
+                mirror = n - 1 - i
+                # the mirror may already be drawn, fall back to a fresh index
+                while mirror in chosen:
+                    mirror = self.rng.randrange(n)
+                chosen.add(mirror)
+            return [population[i] for i in sorted(chosen)]
+
+        else:
+            self._quasi_offset = (self._quasi_offset + self.GOLDEN_RATIO) % 1.0
+            u = self._quasi_offset
+            return [population[int((i + u) * n / k)] for i in xrange(k)]
+
+
+# every two card holding, in a fixed order, for 1,326-entry range weight vectors
+DECK = sorted(dc.Deck.GetFullDeck())
+HOLDINGS = np.array(list(combinations(DECK, 2)), dtype=np.int64)
+HOLDING_INDEX = dict(((c1, c2), i) for i, (c1, c2) in enumerate(combinations(DECK, 2)))
+_DECK_POSITION = dict((card, i) for i, card in enumerate(DECK))
+_HOLDING_MASKS = _deck_masks([[_DECK_POSITION[c] for c in h] for h in HOLDINGS])
+
+
+def holding_index(card1, card2):
+    '''Position of a holding (deuces card ints, either order) in HOLDINGS.'''
+    return HOLDING_INDEX[(min(card1, card2), max(card1, card2))]
+
+
+def uniform_range():
+    return np.ones(len(HOLDINGS))
+
+
+class RangeEquity(object):
+    '''Our equity against opponents holding weighted ranges rather than
+    uniformly random hands.
+
+    Built once per hand, usually on the flop, it holds the showdown matrix
+    of our holding against each of the 1,326 holdings on every runout of
+    the board: 1 we win, 0.5 tie, 0 we lose or the holding is impossible.
+    A range is a weight per holding (indexed like HOLDINGS), and equity
+    against it is a matrix-vector product. On later streets the same
+    matrix is reused, keeping only the runouts that contain the new cards.
+
+        hand = RangeEquity(cards, flop, evaluator)
+        hand.equity([villain_weights])
+        hand.equity([villain_weights], board=flop + [turn])
+
+    With several opponents, each one's chance of being beaten is taken as
+    independent given the runout, ignoring the cards they block from each
+    other.
+    '''
+
+    def __init__(self, cards, board, evaluator):
+        batch = batch_evaluator(evaluator)
+        self.cards = list(cards)
+        self.board = list(board)
+
+        deck = [i for i, c in enumerate(DECK) if c not in cards and c not in board]
+        runouts = list(combinations(deck, 5 - len(board)))
+        runout_idx = np.array(runouts, dtype=np.int64).reshape(len(runouts), 5 - len(board))
+        self.runout_masks = _deck_masks(runout_idx)
+
+        boards = np.hstack([np.tile(self.board, (len(runouts), 1)),
+                            np.array(DECK, dtype=np.int64)[runout_idx]])
+        ours = batch.rank_matrix(boards, np.array([self.cards]))
+        theirs = batch.rank_matrix(boards, HOLDINGS)
+
+        dead = _deck_masks([[_DECK_POSITION[c] for c in self.cards + self.board]])[0]
+        self.valid = ((self.runout_masks[:, None] & _HOLDING_MASKS[None, :]) == 0) & \
+            ((_HOLDING_MASKS & dead) == 0)[None, :]
+        self.showdown = np.where(self.valid, (np.sign(
+            theirs.astype(np.int32) - ours.astype(np.int32)) + 1) / 2.0, 0.0)
+
+    def _rows(self, board):
+        if board is None or len(board) == len(self.board):
+            return slice(None)
+        if list(board[:len(self.board)]) != self.board:
+            raise ValueError("Board %s does not extend the board this hand was built on" % (board,))
+        new_cards = _deck_masks([[_DECK_POSITION[c] for c in board[len(self.board):]]])[0]
+        return (self.runout_masks & new_cards) == new_cards
+
+    def equity(self, ranges, board=None):
+        '''Chance of beating every opponent at showdown (ties count half),
+        for a list of range weight vectors, one per opponent. None when there
+        are no opponents, or no runout leaves them a holding.'''
+        if not ranges:
+            return None
+        rows = self._rows(board)
+        showdown = self.showdown[rows]
+        valid = self.valid[rows]
+
+        beat_all = np.ones(len(showdown))
+        runout_weight = np.ones(len(showdown))
+        for weights in ranges:
+            weights = np.asarray(weights, dtype=float)
+            beaten = showdown.dot(weights)
+            possible = valid.dot(weights)
+            beat_all *= np.where(possible > 0, beaten / np.maximum(possible, 1e-12), 0.0)
+            runout_weight *= possible
+
+        total = runout_weight.sum()
+        if total <= 0:
+            return None
+        return float(beat_all.dot(runout_weight) / total)
@@ -0,0 +1,166 @@
+'''Independent Chip Model (ICM): tournament equity from chip stacks.
+
+Smithers plays winner-take-all tournaments, but chips won in a hand are
+not worth the same as tournament equity as soon as more than one place is
+paid. ICM (Malmuth-Harville) values a stack by the chance of finishing in
+each paid place: a player finishes first with probability stack/total,
+and the remaining places are filled the same way among the players left.
+
+    icm_equities([5000, 3000, 2000], payouts=(0.5, 0.3, 0.2))
+
+The exact calculation is a dynamic program over the subsets of players
+already placed, each subset visited once however many orders lead to it.
+That is at most 2^11 subsets for 11 players. Fields too large for that
+are approximated by sampling finishing orders (MAX_EXACT_SUBSETS).
+'''
+import numpy as np
+
+WINNER_TAKE_ALL = (1.0,)
+
+# above this many subsets the exact recursion is swapped for sampling
+MAX_EXACT_SUBSETS = 2 ** 11
+APPROXIMATION_SAMPLES = 4000
+
+_cache = {}
+_CACHE_SIZE = 1024
+_draws = {}
+
+
+def _paid_places(payouts, players):
+    payouts = list(payouts)[:players]
+    while payouts and payouts[-1] == 0:
+        payouts.pop()
+    return payouts
+
+
+def _subsets_needed(players, places):
+    '''Subsets of placed players the exact recursion visits.'''
+    total, choose = 0, 1
+    for k in xrange(places):
+        total += choose
+        choose = choose * (players - k) // (k + 1)
+    return total
+
+
+def finish_probabilities(stacks, places):
+    '''probabilities[i][k]: chance player i finishes in place k (0 = winner),
+    for the first `places` places, by the exact Malmuth-Harville recursion.'''
+    n = len(stacks)
+    total = float(sum(stacks))
+    probabilities = [[0.0] * places for _ in xrange(n)]
+    alive = [i for i in xrange(n) if stacks[i] > 0]
+
+    # placed subset (bitmask) -> [probability, chips of the placed players]
+    level = {0: [1.0, 0]}
+    for place in xrange(places):
+        next_level = {}
+        for mask, (p, placed_chips) in level.iteritems():
+            remaining = total - placed_chips
+            if remaining <= 0:
+                continue
+            for i in alive:
+                bit = 1 << i
+                if mask & bit:
+                    continue
+                q = p * stacks[i] / remaining
+                probabilities[i][place] += q
+                if place + 1 < places:
+                    entry = next_level.get(mask | bit)
+                    if entry is None:
+                        next_level[mask | bit] = [q, placed_chips + stacks[i]]
+                    else:
+                        entry[0] += q
+        level = next_level
+    return probabilities
+
+
+def _exponential_draws(samples, players, seed):
+    '''Standard exponential draws, kept for the next call: call_threshold
+    asks for the same ones three times per decision.'''
+    key = (samples, players, seed)
+    if key not in _draws:
+        _draws.clear()
+        _draws[key] = np.random.RandomState(seed).standard_exponential((samples, players))
+    return _draws[key]
+
+
+def sampled_finish_probabilities(stacks, places, samples=APPROXIMATION_SAMPLES, seed=0):
+    '''Same as finish_probabilities, estimated from sampled finishing orders.
+
+    Giving every player an exponential "bust out" time with rate equal to
+    their stack and sorting makes P(i first) = stack_i/total, and because
+    exponentials are memoryless, every later place follows the same
+    Harville rule. Error is about 1/sqrt(samples). Only the first `places`
+    bust out times of each sample are ever sorted.'''
+    stacks = np.asarray(stacks, dtype=float)
+    alive = stacks > 0
+    with np.errstate(divide="ignore"):
+        times = _exponential_draws(samples, len(stacks), seed) / np.where(alive, stacks, 0.0)
+    if places < len(stacks):
+        top = np.argpartition(times, places - 1, axis=1)[:, :places]
+    else:
+        top = np.tile(np.arange(len(stacks)), (samples, 1))
+    rows = np.arange(samples)[:, None]
+    order = top[rows, np.argsort(times[rows, top], axis=1)]
+
+    probabilities = np.zeros((len(stacks), places))
+    for place in xrange(places):
+        probabilities[:, place] = np.bincount(order[:, place], minlength=len(stacks))
+    probabilities /= samples
+    probabilities[~alive] = 0.0
+    return probabilities.tolist()
+
+
+def icm_equities(stacks, payouts=WINNER_TAKE_ALL):
+    '''Tournament equity of each stack, in the units of the payouts (with
+    the default winner-take-all payout that is each player's chance of
+    winning the tournament).'''
+    stacks = tuple(stacks)
+    payouts = _paid_places(payouts, len(stacks))
+    key = (stacks, tuple(payouts))
+    if key in _cache:
+        return list(_cache[key])
+
+    if not payouts or sum(stacks) <= 0:
+        equities = [0.0] * len(stacks)
+    else:
+        if _subsets_needed(len(stacks), len(payouts)) <= MAX_EXACT_SUBSETS:
+            probabilities = finish_probabilities(stacks, len(payouts))
+        else:
+            probabilities = sampled_finish_probabilities(stacks, len(payouts))
+        equities = [sum(p * prize for p, prize in zip(player, payouts))
+                    for player in probabilities]
+
+    if len(_cache) >= _CACHE_SIZE:
+        _cache.clear()
+    _cache[key] = equities
+    return list(equities)
+
+
+def call_threshold(stacks, me, call, pot, payouts=WINNER_TAKE_ALL, villains=None):
+    '''Minimum chance of winning the hand for a call of `call` chips into
+    `pot` to gain tournament equity, where stacks are the chips each player
+    has behind. Who wins the pot when we don't is unknown, it is spread
+    evenly over `villains` (by default everyone else still holding chips).
+
+    With winner-take-all payouts this is call/(pot + call), plain pot odds,
+    and it climbs above that as soon as more places are paid.'''
+    if villains is None:
+        villains = [i for i, s in enumerate(stacks) if i != me and s > 0]
+    if not villains or call <= 0:
+        return 0.0
+
+    def after(our_stack, their_winnings):
+        stacks_after = list(stacks)
+        stacks_after[me] = our_stack
+        for v in villains:
+            stacks_after[v] += float(their_winnings) / len(villains)
+        return icm_equities(stacks_after, payouts)[me]
+
+    call = min(call, stacks[me])
+    fold = after(stacks[me], pot)
+    win = after(stacks[me] + pot, 0)
+    lose = after(stacks[me] - call, pot + call)
+    if win <= lose:
+        return 1.0
+    return min(1.0, max(0.0, (fold - lose) / (win - lose)))
@@ -0,0 +1,366 @@
+'''Load-generation harness for capacity planning a Smithers deployment.
+
+trial_game.py sits a handful of RandomBots at one table. This script starts
+an arbitrary number of bots drawn from a configurable mix of bot classes,
+brings them up on a ramp-up schedule, slows their decisions down with a
+think-time model and watches the server's broadcast socket to report
+throughput (hands/sec, moves/sec) and move-latency percentiles.
+
+    python load_generator.py 200 --mix random:80,poker:15,odds:5 \
+        --ramp 30 --think exponential --think-mean 0.2 --duration 120
+
+Move latency is measured from the server's MOVE_REQUEST for a player to the
+MOVE broadcast confirming it, so it includes the bot's think time, the HTTP
+round trip and the server's own processing.
+'''
+from smithers_framework import BotFramework
+
+import argparse
+import imp
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from multiprocessing import Process, Queue
+
+
+def _load_bad_odds_bot():
+    # monty-odds.py is not an importable module name, and pulls in deuces,
+    # so only load it when the mix actually asks for it
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "monty-odds.py")
+    return imp.load_source("monty_odds", path).BadOddsBot
+
+
+def _load_poker_bot():
+    from monty import PokerBot
+    return PokerBot
+
+
+def _load_random_bot():
+    from monty_random import RandomBot
+    return RandomBot
+
+
+BOT_LOADERS = {
+    "random": _load_random_bot,
+    "poker": _load_poker_bot,
+    "odds": _load_bad_odds_bot,
+}
+
+
+def parse_mix(mix):
+    '''Parse a mix spec such as "random:80,poker:15,odds:5" into a list of
+    (bot_kind, weight). A kind without a weight counts as weight 1, every
+    weight must be positive and every kind appear once.'''
+    parsed = []
+    for part in mix.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        kind, _, weight = part.partition(":")
+        if kind not in BOT_LOADERS:
+            raise ValueError("Unknown bot kind %r, expected one of: %s" % (
+                kind, ", ".join(sorted(BOT_LOADERS))))
+        if kind in [k for k, _ in parsed]:
+            raise ValueError("Bot kind %r appears more than once in mix %r" % (kind, mix))
+        weight = float(weight) if weight else 1.0
+        if weight <= 0:
+            raise ValueError("Bot kind %r has weight %s, weights must be positive" % (
+                kind, weight))
+        parsed.append((kind, weight))
+    if not parsed:
+        raise ValueError("Bot mix %r names no bots" % mix)
+    return parsed
+
+
+def assign_bot_kinds(bot_no, mix):
+    '''Deterministically split bot_no bots across the weighted mix (largest
+    remainder), interleaving kinds so a ramp-up brings them in evenly.'''
+    total = sum(w for _, w in mix)
+    quotas = [(kind, bot_no * w / total) for kind, w in mix]
+    counts = dict((kind, int(q)) for kind, q in quotas)
+    leftover = bot_no - sum(counts.values())
+    by_remainder = sorted(quotas, key=lambda kq: kq[1] - int(kq[1]), reverse=True)
+    for kind, _ in by_remainder[:leftover]:
+        counts[kind] += 1
+
+    kinds = []
+    placed = dict((kind, 0) for kind, _ in mix)
+    for i in xrange(bot_no):
+        # pick the kind that is furthest behind its share at this point
+        kind = max(counts, key=lambda k: (counts[k] * (i + 1)) / float(bot_no) - placed[k])
+        placed[kind] += 1
+        kinds.append(kind)
+    return kinds
+
+
+def ramp_schedule(bot_no, ramp, steps=0):
+    '''Start offsets (seconds) for each bot. With steps=0 bots arrive evenly
+    over `ramp` seconds, otherwise they arrive in `steps` equal batches.'''
+    if bot_no <= 0 or ramp <= 0:
+        return [0.0] * bot_no
+    if steps <= 0:
+        return [ramp * i / float(bot_no) for i in xrange(bot_no)]
+    per_step = ramp / float(steps)
+    return [per_step * (i * steps // bot_no) for i in xrange(bot_no)]
+
+
+def think_time_model(model, mean, rng=random):
+    '''Returns a callable producing the seconds a bot spends "thinking"
+    before each move.'''
+    if model == "none" or mean <= 0:
+        return lambda: 0.0
+    elif model == "constant":
+        return lambda: mean
+    elif model == "uniform":
+        return lambda: rng.uniform(0, 2 * mean)
+    elif model == "exponential":
+        return lambda: rng.expovariate(1.0 / mean)
+    raise ValueError("Unknown think time model %r" % model)
+
+
+def percentile(sorted_values, pct):
+    '''Nearest-rank percentile of an already sorted list.'''
+    if not sorted_values:
+        return None
+    rank = int(math.ceil(pct / 100.0 * len(sorted_values))) - 1
+    return sorted_values[max(0, min(rank, len(sorted_values) - 1))]
+
+
+class ServerMonitor(BotFramework):
+    '''Passive listener on the Smithers broadcast socket. It never registers
+    or plays, it only counts hands and moves and times each MOVE_REQUEST
+    against the MOVE that answers it.'''
+
+    def __init__(self, server_url, listening_socket=None):
+        super(ServerMonitor, self).__init__("__monitor__", server_url, listening_socket)
+        self._lock = threading.Lock()
+        self._pending_requests = {}
+        self.latencies = []
+        self.hands = 0
+        self.moves = 0
+        self.messages = 0
+        self.first_hand_at = None
+        self.last_message_at = None
+        self.is_shutdown = False
+
+    def set_up_competitors(self, competitors):
+        pass
+
+    def receive_tournament_start_message(self, players):
+        pass
+
+    def receive_move_message(self, player_name, move, amount, chips_left, is_blind):
+        pass
+
+    def receive_hands_message(self, card1, card2):
+        pass
+
+    def receive_board_message(self, board, pot):
+        pass
+
+    def receive_results_message(self, results_list):
+        pass
+
+    def receive_broke_message(self, names):
+        pass
+
+    def receive_tournament_winner_message(self, name):
+        pass
+
+    def on_move_request(self, min_raise, call, pot, current_bet, chips):
+        return ("FOLD", 0)
+
+    def record(self, msg, now):
+        m_type = msg.get("type", None)
+        with self._lock:
+            self.messages += 1
+            self.last_message_at = now
+
+            if m_type == "DEALT_HANDS" and self.first_hand_at is None:
+                self.first_hand_at = now
+            elif m_type == "RESULTS":
+                self.hands += 1
+            elif m_type == "MOVE_REQUEST":
+                self._pending_requests[msg.get("name", None)] = now
+            elif m_type == "MOVE":
+                self.moves += 1
+                requested_at = self._pending_requests.pop(msg.get("name", None), None)
+                if requested_at is not None:
+                    self.latencies.append(now - requested_at)
+
+    def play(self):
+        self._connect_to_socket()
+        while True:
+            msg = self._get_message_from_socket()
+            self.record(msg, time.time())
+            m_type = msg.get("type", None)
+            if m_type == "PING":
+                self.socket.send("PONG")
+            elif m_type == "SHUTDOWN":
+                self.is_shutdown = True
+                self.socket.close()
+                return
+
+    def report(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            hands, moves = self.hands, self.moves
+            start, end = self.first_hand_at, self.last_message_at
+            messages = self.messages
+
+        elapsed = (end - start) if (start is not None and end > start) else 0.0
+        return {
+            "elapsed": elapsed,
+            "messages": messages,
+            "hands": hands,
+            "moves": moves,
+            "hands_per_sec": hands / elapsed if elapsed else 0.0,
+            "moves_per_sec": moves / elapsed if elapsed else 0.0,
+            "latency": dict(
+                [("p%d" % p, percentile(latencies, p)) for p in (50, 90, 95, 99)] +
+                [("max", latencies[-1] if latencies else None),
+                 ("samples", len(latencies))]),
+        }
+
+
+def run_bot(name, kind, server_url, listening_socket, start_at, think, think_mean,
+            seed, quiet, results):
+    '''Body of each bot process: wait for its slot in the ramp, then play.'''
+    if quiet:
+        sys.stdout = open(os.devnull, "w")
+    random.seed(seed)
+    delay = start_at - time.time()
+    if delay > 0:
+        time.sleep(delay)
+
+    status, error = "WIN", None
+    try:
+        bot = BOT_LOADERS[kind]()(name, server_url, listening_socket)
+        think_time = think_time_model(think, think_mean)
+        decide = bot.on_move_request
+
+        def on_move_request(*args):
+            time.sleep(think_time())
+            return decide(*args)
+        bot.on_move_request = on_move_request
+
+        bot.register()
+        bot.play()
+    except Exception as e:
+        status, error = "NOPE", "%s: %s" % (type(e).__name__, e)
+    results.put((name, kind, status, error))
+
+
+def run_load_test(args):
+    mix = parse_mix(args.mix)
+    kinds = assign_bot_kinds(args.bots, mix)
+    offsets = ramp_schedule(args.bots, args.ramp, args.ramp_steps)
+
+    shared_name = None
+    if "odds" in kinds and args.share_tables:
+        # publish the seven card tables once, every BadOddsBot attaches to them
+        from adjusted_deuces import DistLookupTable
+        import shared_tables
+        shared_name = "%s-%d" % (args.prefix.lower(), os.getpid())
+        DistLookupTable().publish(shared_name, overwrite=True)
+        os.environ[shared_tables.ENV_VAR] = shared_name
+
+    try:
+        monitor = ServerMonitor(args.server, args.socket)
+        monitor_thread = threading.Thread(target=monitor.play, name="monitor")
+        monitor_thread.daemon = True
+        monitor_thread.start()
+
+        results = Queue()
+        began = time.time()
+        processes = []
+        for i, (kind, offset) in enumerate(zip(kinds, offsets)):
+            name = "%s%03d" % (args.prefix, i)
+            p = Process(target=run_bot, args=(
+                name, kind, args.server, args.socket, began + offset, args.think,
+                args.think_mean, args.seed + i, not args.verbose, results))
+            p.daemon = True
+            p.start()
+            processes.append(p)
+
+        deadline = began + args.duration
+        while time.time() < deadline and not monitor.is_shutdown:
+            if not any(p.is_alive() for p in processes):
+                break
+            time.sleep(0.5)
+
+        for p in processes:
+            if p.is_alive():
+                p.terminate()
+    finally:
+        if shared_name:
+            shared_tables.unlink(shared_name)
+
+    outcomes = []
+    while not results.empty():
+        outcomes.append(results.get())
+
+    report = monitor.report()
+    report["bots"] = dict((kind, kinds.count(kind)) for kind, _ in mix)
+    report["failures"] = [o for o in outcomes if o[2] != "WIN"]
+    return report
+
+
+def print_report(report):
+    print "bots: %s" % ", ".join("%s=%d" % kv for kv in sorted(report["bots"].items()))
+    print "observed %.1fs: %d messages, %d hands, %d moves" % (
+        report["elapsed"], report["messages"], report["hands"], report["moves"])
+    print "throughput: %.2f hands/sec, %.2f moves/sec" % (
+        report["hands_per_sec"], report["moves_per_sec"])
+
+    latency = report["latency"]
+    if latency["samples"]:
+        print "move latency (%d samples): %s" % (latency["samples"], "  ".join(
+            "%s=%.1fms" % (k, latency[k] * 1000) for k in ("p50", "p90", "p95", "p99", "max")))
+    else:
+        print "move latency: no samples"
+
+    for name, kind, status, error in report["failures"]:
+        print "FAILED %s (%s): %s" % (name, kind, error)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("bots", type=int, help="number of bots to start")
+    parser.add_argument("--mix", default="random",
+                        help="weighted bot mix, e.g. random:80,poker:15,odds:5")
+    parser.add_argument("--server", default="http://localhost:6767")
+    parser.add_argument("--socket", default=None,
+                        help="raw zmq socket, e.g. tcp://127.0.0.1:9950 (default: websocket)")
+    parser.add_argument("--prefix", default="LOAD", help="bot name prefix")
+    parser.add_argument("--ramp", type=float, default=0.0,
+                        help="seconds over which to bring all bots up")
+    parser.add_argument("--ramp-steps", type=int, default=0,
+                        help="bring bots up in this many batches (0 = linear)")
+    parser.add_argument("--think", default="none",
+                        choices=["none", "constant", "uniform", "exponential"])
+    parser.add_argument("--think-mean", type=float, default=0.0,
+                        help="mean think time in seconds")
+    parser.add_argument("--duration", type=float, default=60.0,
+                        help="stop after this many seconds")
+    parser.add_argument("--share-tables", action="store_true",
+                        help="BadOddsBots attach to one shared copy of the seven card "
+                             "tables, trading a little batch evaluation speed for memory")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, help="also write the report here")
+    parser.add_argument("--verbose", action="store_true", help="keep bot output")
+    args = parser.parse_args(argv)
+
+    report = run_load_test(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
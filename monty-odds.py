@@ -1,7 +1,8 @@
 from smithers_framework import BotFramework
 from adjusted_deuces import deuces as dc
+import equity
+import icm
 
-import random
 from collections import OrderedDict
 from itertools import combinations
 
@@ -12,10 +13,12 @@ class BadOddsBot(BotFramework):
     it works out all scores of the hands it could have and their distribution. 
     It works out an expected value and plays these odds. 
 
-    It does not consider what the opposition has or even distinguish between the 
-    cards in its hand (that no other bot can have) and table cards. This means that
-    if 3 of a kind are on the table it will bet aggressively, even if this means 
-    opposition could be looking full house or even 4 of a kind.
+    Its win rate is the exact chance of beating every opponent still in the hand
+    over all runouts of the board (equity.RangeEquity). Each opponent holds a 
+    range from opponent_ranges, uniform over the holdings left unless a model 
+    puts something there, so out of the box it still has no idea what the 
+    opposition actually has: three of a kind on the table are only as scary 
+    as the full houses a random hand makes of them.
 
     The aim is this should run in about half a second or less.  
     '''
@@ -25,6 +28,11 @@ class BadOddsBot(BotFramework):
         self.competitors = OrderedDict()
         self.CompetitorModel = dict  # insert your own class here
         self.evaluator = dc.Evaluator()
+        # building or loading the seven card tables behind RangeEquity takes up
+        # to a few seconds, better here than inside the first flop's decision
+        equity.batch_evaluator(self.evaluator)
+        # tournament payouts for ICM, Smithers is winner-take-all
+        self.payouts = icm.WINNER_TAKE_ALL
         
         self.cards = None
         self.board = []
@@ -33,6 +41,13 @@ class BadOddsBot(BotFramework):
         self.win_odds = None
         self._deuces_rank = None
 
+        # weights over equity.HOLDINGS per competitor name, uniform if missing
+        self.opponent_ranges = {}
+        self.range_equity = None
+        self.range_odds = None
+        self.folded = set()
+        self.busted = set()
+
         self.not_broke_competitors = 0
         self.not_folded_competitors = 0
 
@@ -49,6 +64,10 @@ class BadOddsBot(BotFramework):
             self.competitors[c["name"]] = comp
 
     def receive_tournament_start_message(self, players):
+        for p in players:
+            if p["name"] in self.competitors:
+                self.competitors[p["name"]]["chips"] = p["chips"]
+        self.busted = set()
         self.not_broke_competitors = len(self.competitors)
         self.not_folded_competitors = len(self.competitors)
         print "tournament starting: %s players: %s" % (
@@ -59,7 +78,10 @@ class BadOddsBot(BotFramework):
         #       "player: %s, move: %s, amount: %s, chips_left: %s, is a blind? %s" % (
         #           player_name, move, amount, chips_left, is_blind)
         print "%s %s" %(player_name, move)
+        if player_name in self.competitors:
+            self.competitors[player_name]["chips"] = chips_left
         if move=="FOLD":
+            self.folded.add(player_name)
             self.not_folded_competitors -= 1
         pass
 
@@ -77,22 +99,20 @@ class BadOddsBot(BotFramework):
         dc.Card.print_pretty_cards(self.cards)
         dc.Card.print_pretty_cards(self.board)
 
-        if len(board) == 3:
-            self.win_odds = self.monte_carlo_expected_winnings(self.cards, self.board, self.evaluator, 90) 
-        elif len(board) == 4:
-            self.win_odds = self.monte_carlo_expected_winnings(self.cards, self.board, self.evaluator, 990) 
-        elif len(board) == 5:
-            self.win_odds = self.monte_carlo_expected_winnings(self.cards, self.board, self.evaluator, 990) 
-
+        # the showdown matrix is built on the first board and reused on later streets
+        if self.range_equity is None:
+            self.range_equity = equity.RangeEquity(self.cards, self.board, self.evaluator)
+        self.win_odds = self.range_equity.equity([equity.uniform_range()], self.board)
         print "\t1:2:1 %.2f" %self.win_odds
-        # pow(self.win_odds, self.not_folded_competitors)
-        # self.win_odds = pow(self.win_odds, self.not_folded_competitors)
 
 
     def receive_results_message(self, results_list):
         self.sklansky = 0
         self.not_folded_competitors = self.not_broke_competitors
         self.win_odds = None
+        self.range_equity = None
+        self.range_odds = None
+        self.folded = set()
         self.percentile = None
         self.cards = None
         print "received the results of the hand:"
@@ -100,12 +120,41 @@ class BadOddsBot(BotFramework):
             print "RESULTS: player: %s, winnings: %s, hand: %s" % (r[0], r[1], r[2])
 
     def receive_broke_message(self, names):
+        self.busted.update(names)
         self.not_broke_competitors -= 1
         print "player(s): %s went bust" % (", ".join(names))
 
     def receive_tournament_winner_message(self, name):
         print "player: %s won the tournament" % name
 
+    def opponents_in_hand(self):
+        '''Competitors who can still win this pot, all in players included.'''
+        return [name for name in self.competitors
+                if name not in self.folded and name not in self.busted]
+
+    def update_range_odds(self):
+        '''Chance of beating every opponent still in the hand, with their 
+        ranges from opponent_ranges. Folds come in between boards, so this is
+        worked out again for every decision.'''
+        if self.range_equity is None:
+            self.range_odds = None
+        else:
+            uniform = equity.uniform_range()
+            ranges = [self.opponent_ranges.get(name, uniform) 
+                      for name in self.opponents_in_hand()]
+            self.range_odds = self.range_equity.equity(ranges, self.board)
+        return self.range_odds
+
+    def icm_call_odds(self, call, pot, chips):
+        '''Win rate a call needs to gain tournament equity (ICM) rather than 
+        chips. Equals pot odds while the tournament is winner-take-all. When 
+        we lose, the pot goes to one of the opponents still in the hand.'''
+        names = list(self.competitors)
+        stacks = [chips] + [self.competitors[n].get("chips", 0) for n in names]
+        in_hand = set(self.opponents_in_hand())
+        villains = [i + 1 for i, n in enumerate(names) if n in in_hand]
+        return icm.call_threshold(stacks, 0, call, pot, self.payouts, villains)
+
     def on_move_request(self, min_raise, call, pot, current_bet, chips):
         moves = [
             ("RAISE_TO", min_raise),
@@ -114,10 +163,11 @@ class BadOddsBot(BotFramework):
         ]
 
         print  "\tTO CALL:", call, " POT: ", pot, " CURRENT BET", current_bet
-        if self.win_odds:
-            multiplayer_odds = pow(self.win_odds, self.not_folded_competitors)
+        if self.update_range_odds() is not None:
+            multiplayer_odds = self.range_odds
             
             pot_odds = float(call)/float(call - current_bet + pot)
+            pot_odds = max(pot_odds, self.icm_call_odds(call - current_bet, pot, chips))
             raise_odds = float(min_raise-current_bet)/float(min_raise-current_bet + pot)
             
             print "\tWIN RATE: %.2f  POT ODDS: %.2f  HEADSUP ODDS: %.2f" %(multiplayer_odds*100,pot_odds *100, self.win_odds*100 )
@@ -136,36 +186,51 @@ class BadOddsBot(BotFramework):
         print "\tmoved: %s, %s" % move
         return move
 
-    def monte_carlo_expected_winnings(self, cards, board, evaluator, sample):
+    def monte_carlo_expected_winnings(self, cards, board, evaluator, sample, sampler=None):
+        '''Estimate of win_odds by sampling opponent holdings on every runout.
+        The bot plays on exact range equity, this is kept for comparison: pass
+        e.g. equity.EquitySampler(seed=1, mode="stratified") for a 
+        reproducible, lower variance estimate.'''
         if not cards or not board:
             return -1
+        sampler = sampler or equity.EquitySampler()
 
         full_deck = set(dc.Deck.GetFullDeck())
-        active_deck = full_deck - set(cards+board)
+        active_deck = sorted(full_deck - set(cards+board))
         missing = 5 - len(board)    
 
+        # opponent holdings ordered by how strong they are on the current board,
+        # so the stratified sampling modes spread every sample from weak to strong
+        holdings = sorted(combinations(active_deck, 2), 
+                          key=lambda h: evaluator.evaluate(list(h), board))
+
         winners = []
         for c in combinations(active_deck, missing):
             new_board = board + list(c)
+            combos = [h for h in holdings if h[0] not in c and h[1] not in c]
 
             our_hand = evaluator.evaluate(cards, new_board)  
-            result = self.monte_carlo_sample(our_hand, cards, new_board, evaluator, sample)
+            result = self.monte_carlo_sample(our_hand, cards, new_board, evaluator, sample, 
+                                             sampler, combos)
     
             winners.append(result)
             
         # print "PROBABILITY OF WINNING %.2f " % (float(sum(winners)*100)/float(len(winners)))
         return float(sum(winners))/float(len(winners))
 
-    def monte_carlo_sample(self, our_score, our_cards, board, evaluator, sample_number):
-        full_deck = set(dc.Deck.GetFullDeck())
-        active_deck = full_deck - set(our_cards+board)
-        missing = 2
+    def monte_carlo_sample(self, our_score, our_cards, board, evaluator, sample_number, 
+                           sampler=None, combos=None):
+        sampler = sampler or equity.EquitySampler()
+        if combos is None:
+            full_deck = set(dc.Deck.GetFullDeck())
+            # sorted, so the same seed always draws the same sample
+            active_deck = sorted(full_deck - set(our_cards+board))
+            missing = 2
+            combos = [c for c in combinations(active_deck, missing)]
 
         winners = 0
 
-        combos = [c for c in combinations(active_deck, missing)]
-
-        for their_cards in random.sample(combos, sample_number):
+        for their_cards in sampler.sample(combos, sample_number):
             their_score = evaluator.evaluate(list(their_cards), board)
             if our_score <= their_score:
                 winners += 1
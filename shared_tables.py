@@ -0,0 +1,103 @@
+'''Read-only lookup tables shared between bot processes.
+
+A table set is a directory of .npy files published under a name in shared
+memory (/dev/shm where it exists). Processes attach to it by name with
+numpy's mmap_mode="r", so however many bots run on a host, the pages are
+held once by the OS page cache rather than once per process.
+
+    shared_tables.publish("table-1", {"unsuited_keys": keys, ...})
+    arrays = shared_tables.attach("table-1")
+
+adjusted_deuces.DistLookupTable.publish/attach build on this for the deuces
+rank tables; any other precomputed arrays (equity tables etc.) can be
+published alongside them.
+'''
+import numpy as np
+
+import os
+import shutil
+import tempfile
+
+SHM_ROOT = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+# bots read this to find the table set published by whatever launched them
+ENV_VAR = "MONTY_SHARED_TABLES"
+
+
+def segment_path(name):
+    return os.path.join(SHM_ROOT, "monty-tables-%s" % name)
+
+
+def publish(name, arrays, overwrite=False):
+    '''Writes the dict of arrays as the table set `name` and returns its path.
+    An existing set is left alone unless overwrite is True. The set appears
+    atomically, so a process attaching concurrently never sees half of it.'''
+    path = segment_path(name)
+    if os.path.isdir(path) and not overwrite:
+        return path
+
+    tmp_path = tempfile.mkdtemp(prefix=".monty-tables-", dir=SHM_ROOT)
+    try:
+        for key, array in arrays.items():
+            np.save(os.path.join(tmp_path, key + ".npy"), np.ascontiguousarray(array))
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.rename(tmp_path, path)
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    return path
+
+
+def attach(name):
+    '''Maps every array of the table set `name` read-only into this process.'''
+    path = segment_path(name)
+    if not os.path.isdir(path):
+        raise IOError("No shared tables published as %r (looked in %s)" % (name, path))
+    return dict((f[:-len(".npy")], np.load(os.path.join(path, f), mmap_mode="r"))
+                for f in os.listdir(path) if f.endswith(".npy"))
+
+
+def unlink(name):
+    '''Removes the table set. Processes already attached keep their mapping.'''
+    shutil.rmtree(segment_path(name), ignore_errors=True)
+
+
+class SharedRankLookup(object):
+    '''Read-only stand-in for deuces' {prime product: rank} dicts, backed by
+    a sorted key array and a matching rank array.
+
+    A single lookup is a binary search, roughly 10x a dict lookup, so this
+    trades per-call speed for memory. lookup_many does a whole array of
+    prime products in one go and is the fast path.
+    '''
+
+    def __init__(self, keys, ranks):
+        self.keys = keys
+        self.ranks = ranks
+
+    @classmethod
+    def arrays_from_dict(cls, lookup):
+        keys = np.array(sorted(lookup), dtype=np.int64)
+        ranks = np.array([lookup[k] for k in keys], dtype=np.uint16)
+        return keys, ranks
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, prime):
+        i = self.keys.searchsorted(prime)
+        return i < len(self.keys) and self.keys[i] == prime
+
+    def __getitem__(self, prime):
+        i = self.keys.searchsorted(prime)
+        if i < len(self.keys) and self.keys[i] == prime:
+            return int(self.ranks[i])
+        raise KeyError(prime)
+
+    def lookup_many(self, primes):
+        '''Ranks for an array of prime products. Primes that are not in the
+        table give an arbitrary rank, callers mask those out themselves.'''
+        i = self.keys.searchsorted(primes)
+        np.clip(i, 0, len(self.keys) - 1, out=i)
+        return self.ranks[i]
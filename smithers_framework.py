@@ -1,9 +1,102 @@
-import zmq
-import requests
 import json
 import abc
+import threading
+from collections import deque
 
-from websocket import create_connection
+
+class _MessageQueue(object):
+    """ Bounded queue between the reader thread and the strategy thread,
+    see BotFramework.use_reader_thread.
+
+    Messages that have gone stale are coalesced away as newer ones arrive:
+    only the latest board and move request of a hand are worth acting on,
+    a move request the server already resolved (our MOVE arrived) is dead,
+    and a new hand or results makes everything pending from the last hand
+    moot. When the queue is still full, the oldest non essential message
+    (other players' move requests, which the bot never acts on) is dropped.
+    Essential messages are never dropped, they overflow the bound instead:
+    that includes every MOVE and BLIND, which carry folds and chip counts."""
+
+    ESSENTIAL = frozenset(["TOURNAMENT_START", "DEALT_HANDS", "DEALT_BOARD",
+                           "BLIND", "MOVE", "RESULTS", "BROKE", "WINNER",
+                           "SHUTDOWN"])
+
+    def __init__(self, maxsize, name):
+        self.maxsize = maxsize
+        self.name = name
+        self._queue = deque()
+        self._ready = threading.Condition()
+        self._stats = {"received": 0, "pings": 0, "dropped": 0, "coalesced": 0,
+                       "overflowed": 0, "max_depth": 0}
+
+    def _is_essential(self, msg):
+        if isinstance(msg, Exception):
+            return True
+        m_type = msg.get("type", None)
+        if m_type == "MOVE_REQUEST":
+            return msg.get("name", None) == self.name
+        return m_type in self.ESSENTIAL
+
+    def _stale_types(self, msg):
+        """ Types of pending message made stale by msg. """
+        m_type = msg.get("type", None)
+        if m_type in ("DEALT_HANDS", "RESULTS"):
+            return ("DEALT_BOARD", "MOVE_REQUEST")
+        elif m_type == "DEALT_BOARD":
+            return ("DEALT_BOARD",)
+        elif m_type == "MOVE_REQUEST" and msg.get("name", None) == self.name:
+            return ("MOVE_REQUEST",)
+        elif m_type == "MOVE" and msg.get("name", None) == self.name:
+            return ("MOVE_REQUEST",)
+        return ()
+
+    def _coalesce(self, msg):
+        stale_types = self._stale_types(msg)
+        if not stale_types:
+            return
+        kept = deque(m for m in self._queue if isinstance(m, Exception)
+                     or m.get("type", None) not in stale_types
+                     or (m.get("type", None) == "MOVE_REQUEST" and m.get("name", None) != self.name))
+        self._stats["coalesced"] += len(self._queue) - len(kept)
+        self._queue = kept
+
+    def put(self, msg):
+        with self._ready:
+            self._stats["received"] += 1
+            if not isinstance(msg, Exception):
+                self._coalesce(msg)
+
+            if len(self._queue) >= self.maxsize:
+                droppable = [m for m in self._queue if not self._is_essential(m)]
+                if droppable:
+                    self._queue.remove(droppable[0])
+                    self._stats["dropped"] += 1
+                elif not self._is_essential(msg):
+                    self._stats["dropped"] += 1
+                    return
+                else:
+                    self._stats["overflowed"] += 1
+
+            self._queue.append(msg)
+            self._stats["max_depth"] = max(self._stats["max_depth"], len(self._queue))
+            self._ready.notify()
+
+    def get(self):
+        with self._ready:
+            while not self._queue:
+                # a timeout keeps the wait interruptible (Ctrl-C) on python 2
+                self._ready.wait(1.0)
+            return self._queue.popleft()
+
+    def record_ping(self):
+        with self._ready:
+            self._stats["pings"] += 1
+
+    def stats(self):
+        with self._ready:
+            stats = dict(self._stats)
+            stats["depth"] = len(self._queue)
+        return stats
 
 
 class BotFramework(object):
@@ -31,13 +124,24 @@ class BotFramework(object):
         self._last_move = None
         self._is_bust = False
 
+        # set use_reader_thread before play() to read the socket and answer
+        # PINGs on a separate thread, so a slow strategy neither misses a PING
+        # nor works through a backlog of stale messages. queue_stats() reports
+        # on the queue between the two.
+        self.use_reader_thread = False
+        self.message_queue_size = 64
+        self._messages = None
+
     def _connect_to_socket(self):
+        # transports are imported lazily so a bot only pays for the one it uses
         if self.use_web_socket:
+            from websocket import create_connection
             ws_server_url = self.server_url.replace(
                 "http", "ws", 1) + "/watch/"
             print ws_server_url
             self.socket = create_connection(ws_server_url, timeout=9999999)
         else:
+            import zmq
             self.context = zmq.Context()
             self.socket = self.context.socket(zmq.SUB)
 
@@ -54,6 +158,7 @@ class BotFramework(object):
 
     def _send_message_to_server(self, server_url, json_msg):
         # TBD. error checking
+        import requests
         return requests.post(server_url, json=json_msg)
 
     def _extract_tournament_start(self, tournament_start_msg):
@@ -189,76 +294,127 @@ class BotFramework(object):
 
     def play(self):
         self._connect_to_socket()
+        if self.use_reader_thread:
+            return self._play_from_reader_thread()
+
         while True:
             if self.is_debug == True:
                 raw_input("*--------------------*")
             msg = self._get_message_from_socket()
-            m_type = msg.get("type", None)
-
-            if m_type == "TOURNAMENT_START":
-                players = self._extract_tournament_start(msg)
-                if not self.competitors:
-                    self.set_up_competitors(
-                        [p for p in players if p["name"] != self.name])
-                self.receive_tournament_start_message(players)
-
-            elif m_type == "DEALT_HANDS":
-                card_tuple = self._extract_hand(msg)
-                if card_tuple is not None:
-                    card1, card2 = card_tuple
-                    self.receive_hands_message(card1, card2)
-                elif not self._is_bust:
-                    self._is_bust = True
-                    print "<bot_framework.py>: Warning - Gone Bust"
-
-            elif m_type == "DEALT_BOARD":
-                board, pot = self._extract_board(msg)
-                self.receive_board_message(board, pot)
-
-            elif m_type == "BLIND":
-                name, move, bet, chips_left = self._extract_move(msg)
-                self.receive_move_message(name, move, bet, chips_left, True)
-
-            elif m_type == "MOVE":
-                name, move, bet, chips_left = self._extract_move(msg)
-                if name == self.name:  # just sent in move. check it
-                    self.verify_move(name, move, bet, chips_left, msg)
-                else:
-                    self.receive_move_message(
-                        name, move, bet, chips_left, False)
-
-            elif m_type == "RESULTS":
-                results_list = self._extract_results(msg)
-                self.receive_results_message(results_list)
-
-            elif m_type == "BROKE":
-                broke = self._extract_broke(msg)
-                self.receive_broke_message(broke)
-
-            elif m_type == "WINNER":
-                winner = self._extract_winner(msg)
-                self.receive_tournament_winner_message(winner)
-
-            elif m_type == "PING":
-                self.socket.send("PONG")
-
-            elif m_type == "MOVE_REQUEST":
-                if msg.get("name", None) == self.name:
-                    if self.is_test:
-                        raw_input("move requested for %s" % self.name)
-                    min_raise, call, pot, current_bet, chips = self._extract_move_request(
-                        msg)
-                    move = self.on_move_request(
-                        min_raise, call, pot, current_bet, chips)
-                    self._send_move_to_server(move)
-                    self._last_move = move
-
-            elif m_type == "SHUTDOWN":
-                self.socket.close()
+            if not self._handle_message(msg):
                 return
 
+    def _play_from_reader_thread(self):
+        self._messages = _MessageQueue(self.message_queue_size, self.name)
+        reader = threading.Thread(target=self._read_messages, name="%s-reader" % self.name)
+        reader.daemon = True
+        reader.start()
+
+        while True:
+            msg = self._messages.get()
+            if isinstance(msg, Exception):
+                raise msg
+            if self.is_debug == True:
+                raw_input("*--------------------*")
+            if not self._handle_message(msg):
+                return
+
+    def _read_messages(self):
+        '''Reader thread: answers PINGs straight away and queues the rest for
+        the strategy thread.'''
+        try:
+            while True:
+                msg = self._get_message_from_socket()
+                if msg.get("type", None) == "PING":
+                    self.socket.send("PONG")
+                    self._messages.record_ping()
+                    continue
+                self._messages.put(msg)
+                if msg.get("type", None) == "SHUTDOWN":
+                    return
+        except Exception as e:
+            self._messages.put(e)
+
+    def queue_stats(self):
+        '''Depth and drop counters of the reader thread's queue, None when
+        not playing with use_reader_thread.'''
+        return self._messages.stats() if self._messages is not None else None
+
+    def _handle_message(self, msg):
+        '''Dispatches one message to the bot. Returns False on SHUTDOWN.'''
+        m_type = msg.get("type", None)
+
+        if m_type == "TOURNAMENT_START":
+            players = self._extract_tournament_start(msg)
+            if not self.competitors:
+                self.set_up_competitors(
+                    [p for p in players if p["name"] != self.name])
+            self.receive_tournament_start_message(players)
+
+        elif m_type == "DEALT_HANDS":
+            card_tuple = self._extract_hand(msg)
+            if card_tuple is not None:
+                card1, card2 = card_tuple
+                self.receive_hands_message(card1, card2)
+            elif not self._is_bust:
+                self._is_bust = True
+                print "<bot_framework.py>: Warning - Gone Bust"
+
+        elif m_type == "DEALT_BOARD":
+            board, pot = self._extract_board(msg)
+            self.receive_board_message(board, pot)
+
+        elif m_type == "BLIND":
+            name, move, bet, chips_left = self._extract_move(msg)
+            self.receive_move_message(name, move, bet, chips_left, True)
+
+        elif m_type == "MOVE":
+            name, move, bet, chips_left = self._extract_move(msg)
+            if name == self.name and self._last_move is None:
+                # a move we never sent: the server moved for us (e.g. timed
+                # out), possibly before we even saw the request
+                print "<bot_framework.py>: Warning - Server moved for us: %s, %s" % (move, bet)
+            elif name == self.name:  # just sent in move. check it
+                self.verify_move(name, move, bet, chips_left, msg)
+                self._last_move = None
             else:
-                pass
+                self.receive_move_message(
+                    name, move, bet, chips_left, False)
+
+        elif m_type == "RESULTS":
+            results_list = self._extract_results(msg)
+            self.receive_results_message(results_list)
+
+        elif m_type == "BROKE":
+            broke = self._extract_broke(msg)
+            self.receive_broke_message(broke)
+
+        elif m_type == "WINNER":
+            winner = self._extract_winner(msg)
+            self.receive_tournament_winner_message(winner)
+
+        elif m_type == "PING":
+            self.socket.send("PONG")
+
+        elif m_type == "MOVE_REQUEST":
+            if msg.get("name", None) == self.name:
+                if self.is_test:
+                    raw_input("move requested for %s" % self.name)
+                min_raise, call, pot, current_bet, chips = self._extract_move_request(
+                    msg)
+                move = self.on_move_request(
+                    min_raise, call, pot, current_bet, chips)
+                self._send_move_to_server(move)
+                self._last_move = move
+
+        elif m_type == "SHUTDOWN":
+            self.socket.close()
+            return False
+
+        else:
+            pass
+
+        return True
 
 
 if __name__ == "__main__":
@@ -0,0 +1,56 @@
+from adjusted_deuces import DistLookupTable, DistributionsEvaluator
+
+import marshal
+import os
+import shutil
+import tempfile
+
+# number of 7 card hands whose best 5 cards fall in each rank class,
+# straight flush first
+SEVEN_CARD_CLASS_TOTALS = [41584, 224848, 3473184, 4047644, 6180020, 
+                           6461620, 31433400, 58627800, 23294460]
+
+
+def ladder_five_card_percentile(hr):
+    '''The if/elif ladder get_five_card_rank_percentile used to be, one
+    branch per rank class.'''
+    previous_max = 0
+    for class_max in sorted(DistLookupTable.MAX_TO_PERCENTILE):
+        if hr <= class_max:
+            lower_hds_in_rc = (hr - previous_max) * DistLookupTable.MAX_TO_DEGENERACY[class_max]
+            lower_hds_not_in_rc = DistLookupTable.MAX_TO_PERCENTILE[class_max]
+            return float(lower_hds_in_rc + lower_hds_not_in_rc) / float(DistLookupTable.MAX_ALL_HANDS)
+        previous_max = class_max
+
+
+def test_five_card_cdf_matches_ladder():
+    assert len(DistLookupTable.FIVE_CARD_CDF) == DistLookupTable.MAX_HIGH_CARD + 1
+    for hr in xrange(DistLookupTable.MAX_HIGH_CARD + 1):
+        assert abs(DistLookupTable.FIVE_CARD_CDF[hr] - ladder_five_card_percentile(hr)) < 1e-12, hr
+    assert abs(DistLookupTable.FIVE_CARD_CDF[-1] - 1.0) < 1e-12
+
+
+def test_seven_card_class_totals():
+    evaluator = DistributionsEvaluator()
+    evaluator.table.load_seven_card_tables()
+    counts = evaluator.table.seven_card_counts
+    assert sum(counts) == DistLookupTable.MAX_ALL_SEVEN_CARD_HANDS
+
+    totals = [0] * len(SEVEN_CARD_CLASS_TOTALS)
+    for hr in xrange(1, DistLookupTable.MAX_HIGH_CARD + 1):
+        totals[evaluator.get_rank_class(hr) - 1] += counts[hr]
+    assert totals == SEVEN_CARD_CLASS_TOTALS
+
+
+def test_unusable_snapshot_is_rebuilt():
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, "lookup.snapshot")
+        with open(path, "wb") as f:
+            marshal.dump((DistLookupTable.SNAPSHOT_VERSION, {}), f)
+        table = DistLookupTable(snapshot_path=path)
+        assert len(table.flush_lookup) == 1277 + 10
+        assert table.seven_card_counts is None
+        assert DistLookupTable(snapshot_path=path).unsuited_lookup == table.unsuited_lookup
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,131 @@
+from adjusted_deuces import DistributionsEvaluator, deuces as dc
+import equity
+import shared_tables
+
+import numpy as np
+import os
+import random
+from itertools import combinations
+
+evaluator = DistributionsEvaluator()
+
+
+def random_hands(size, count, seed):
+    rng = random.Random(seed)
+    deck = dc.Deck.GetFullDeck()
+    return [rng.sample(deck, size) for _ in xrange(count)]
+
+
+def check_rank_many(size):
+    hands = random_hands(size, 2000, size)
+    ranks = equity.batch_evaluator(evaluator).rank_many(np.array(hands))
+    for hand, rank in zip(hands, ranks):
+        assert rank == evaluator.evaluate(hand[:2], hand[2:]), hand
+
+
+def test_rank_many_matches_evaluate():
+    for size in (5, 6, 7):
+        yield check_rank_many, size
+
+
+def test_rank_matrix_matches_evaluate():
+    rng = random.Random(1)
+    cards = rng.sample(dc.Deck.GetFullDeck(), 15)
+    boards, holdings = [cards[0:5], cards[5:10]], [cards[10:12], cards[12:14], cards[13:15]]
+    ranks = equity.batch_evaluator(evaluator).rank_matrix(np.array(boards), np.array(holdings))
+    assert ranks.shape == (2, 3)
+    for i, board in enumerate(boards):
+        for j, holding in enumerate(holdings):
+            assert ranks[i, j] == evaluator.evaluate(holding, board)
+
+
+def brute_force_hand_strength(cards, board):
+    '''hs and ehs by evaluating every opponent holding and runout.'''
+    deck = [c for c in dc.Deck.GetFullDeck() if c not in cards + board]
+
+    def score(ours, theirs):
+        return 1.0 if ours < theirs else 0.5 if ours == theirs else 0.0
+
+    our_now = evaluator.evaluate(cards, board)
+    now = [score(our_now, evaluator.evaluate(list(h), board)) for h in combinations(deck, 2)]
+
+    runout_equities = []
+    for river in deck:
+        final = board + [river]
+        ours = evaluator.evaluate(cards, final)
+        showdown = [score(ours, evaluator.evaluate(list(h), final))
+                    for h in combinations([c for c in deck if c != river], 2)]
+        runout_equities.append(sum(showdown) / len(showdown))
+    return sum(now) / len(now), sum(runout_equities) / len(runout_equities)
+
+
+def test_ehs_matches_brute_force_on_turn():
+    cards = [dc.Card.new("Ah"), dc.Card.new("Kh")]
+    board = [dc.Card.new(c) for c in ("Qh", "7c", "2h", "9s")]
+    strength = equity.hand_strength_distribution(cards, board, evaluator)
+    hs, ehs = brute_force_hand_strength(cards, board)
+    assert abs(strength.hs - hs) < 1e-9
+    assert abs(strength.ehs - ehs) < 1e-9
+    assert abs(sum(strength.histogram) - 1.0) < 1e-9
+
+
+def test_hand_strength_on_attached_tables():
+    name = "test-equity-%d" % os.getpid()
+    evaluator.table.publish(name, overwrite=True)
+    try:
+        attached = DistributionsEvaluator(shared_name=name)
+        assert attached.table.shared_arrays is not None
+        cards = [dc.Card.new("Td"), dc.Card.new("Ts")]
+        board = [dc.Card.new(c) for c in ("Jd", "4d", "8c")]
+        shared = equity.hand_strength_distribution(cards, board, attached)
+        private = equity.hand_strength_distribution(cards, board, evaluator)
+        assert shared[:-1] == private[:-1]
+        assert (shared.histogram == private.histogram).all()
+    finally:
+        shared_tables.unlink(name)
+
+
+def test_range_equity_against_uniform_is_ehs():
+    cards = [dc.Card.new("9c"), dc.Card.new("8c")]
+    flop = [dc.Card.new(c) for c in ("Tc", "7h", "2c")]
+    turn = flop + [dc.Card.new("Kd")]
+    hand = equity.RangeEquity(cards, flop, evaluator)
+    for board in (flop, turn):
+        ehs = equity.hand_strength_distribution(cards, board, evaluator).ehs
+        assert abs(hand.equity([equity.uniform_range()], board) - ehs) < 1e-9
+    assert hand.equity([], turn) is None
+
+
+def test_sampler_same_seed_same_draws():
+    population = range(500)
+    for mode in equity.EquitySampler.MODES:
+        first = equity.EquitySampler(seed=7, mode=mode)
+        second = equity.EquitySampler(seed=7, mode=mode)
+        for _ in xrange(5):
+            assert first.sample(population, 20) == second.sample(population, 20)
+
+
+def test_sampler_spawned_streams_are_independent():
+    population = range(1000)
+    parent = equity.EquitySampler(seed=3)
+    streams = [parent.spawn(i).sample(population, 50) for i in xrange(4)]
+    assert streams[0] == equity.EquitySampler(seed=3).sample(population, 50)
+    assert streams[1] == parent.spawn(1).sample(population, 50)
+    for i in xrange(len(streams)):
+        for j in xrange(i):
+            # 50 of 1000 each, independent streams share a handful at most
+            assert len(set(streams[i]) & set(streams[j])) < 15
+
+
+def check_distinct(mode):
+    for seed in xrange(50):
+        sampler = equity.EquitySampler(seed=seed, mode=mode)
+        for n in xrange(1, 12):
+            for k in xrange(n + 1):
+                picks = sampler.sample(range(n), k)
+                assert len(picks) == k and len(set(picks)) == k, (mode, seed, n, k, picks)
+
+
+def test_sampler_modes_return_distinct_items():
+    for mode in equity.EquitySampler.MODES:
+        yield check_distinct, mode
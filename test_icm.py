@@ -0,0 +1,62 @@
+import icm
+
+from itertools import permutations
+
+
+def brute_force_equities(stacks, payouts):
+    '''Malmuth-Harville by summing over every complete finishing order.'''
+    equities = [0.0] * len(stacks)
+    for order in permutations(xrange(len(stacks))):
+        p, remaining = 1.0, float(sum(stacks))
+        for i in order:
+            p *= stacks[i] / remaining if remaining else 1.0
+            remaining -= stacks[i]
+        for place, i in enumerate(order[:len(payouts)]):
+            equities[i] += p * payouts[place]
+    return equities
+
+
+def check_equities(stacks, payouts):
+    expected = brute_force_equities(stacks, payouts)
+    for got, want in zip(icm.icm_equities(stacks, payouts), expected):
+        assert abs(got - want) < 1e-9, (stacks, payouts)
+
+
+def test_icm_equities_match_brute_force():
+    for stacks, payouts in [([5000, 3000, 2000], (0.5, 0.3, 0.2)),
+                            ([1200, 800, 800, 400, 100, 50], (0.5, 0.3, 0.2)),
+                            ([10, 20, 30, 40, 50, 60, 70], (0.4, 0.25, 0.15, 0.1, 0.1)),
+                            ([700, 300, 0, 500], (0.65, 0.35))]:
+        yield check_equities, stacks, payouts
+
+
+def test_winner_take_all_equity_is_chip_share():
+    stacks = [400, 250, 250, 100]
+    assert icm.icm_equities(stacks) == [s / 1000.0 for s in stacks]
+
+
+def test_sampled_finish_probabilities_are_close():
+    stacks = [5000, 3000, 2000, 1500, 800]
+    exact = icm.finish_probabilities(stacks, 3)
+    sampled = icm.sampled_finish_probabilities(stacks, 3, samples=100000)
+    for exact_player, sampled_player in zip(exact, sampled):
+        for e, s in zip(exact_player, sampled_player):
+            assert abs(e - s) < 0.01
+
+
+def check_pot_odds(stacks, me, call, pot):
+    threshold = icm.call_threshold(stacks, me, call, pot)
+    assert abs(threshold - float(call) / (pot + call)) < 1e-9
+
+
+def test_winner_take_all_call_threshold_is_pot_odds():
+    for stacks, me, call, pot in [([1000, 1000], 0, 100, 300),
+                                  ([3000, 1500, 500, 2000], 2, 200, 900),
+                                  ([800, 1200, 400], 1, 400, 400)]:
+        yield check_pot_odds, stacks, me, call, pot
+
+
+def test_paid_places_raise_call_threshold():
+    stacks = [3000, 1500, 500, 2000]
+    assert (icm.call_threshold(stacks, 2, 200, 900, (0.5, 0.3, 0.2)) >
+            icm.call_threshold(stacks, 2, 200, 900))
@@ -0,0 +1,52 @@
+from load_generator import assign_bot_kinds, parse_mix, percentile, ramp_schedule
+
+
+def check_rejected(mix):
+    try:
+        parse_mix(mix)
+    except ValueError:
+        return
+    raise AssertionError("mix %r was accepted" % mix)
+
+
+def test_parse_mix():
+    assert parse_mix("random:80, poker:15,odds:5") == [
+        ("random", 80.0), ("poker", 15.0), ("odds", 5.0)]
+    assert parse_mix("random,odds:2,") == [("random", 1.0), ("odds", 2.0)]
+
+
+def test_parse_mix_rejects_bad_mixes():
+    for mix in ("", "monkey:3", "random:-1,odds:2", "random:0", "random:1,random:2"):
+        yield check_rejected, mix
+
+
+def test_assign_bot_kinds_follows_weights():
+    kinds = assign_bot_kinds(20, [("random", 80), ("poker", 15), ("odds", 5)])
+    assert len(kinds) == 20
+    assert (kinds.count("random"), kinds.count("poker"), kinds.count("odds")) == (16, 3, 1)
+
+
+def test_assign_bot_kinds_interleaves_kinds():
+    kinds = assign_bot_kinds(6, [("random", 1), ("poker", 1)])
+    assert kinds in (["random", "poker"] * 3, ["poker", "random"] * 3)
+
+
+def test_assign_bot_kinds_largest_remainder():
+    kinds = assign_bot_kinds(10, [("random", 1), ("poker", 1), ("odds", 1)])
+    assert sorted(kinds.count(k) for k in ("random", "poker", "odds")) == [3, 3, 4]
+
+
+def test_ramp_schedule():
+    assert ramp_schedule(3, 0) == [0.0, 0.0, 0.0]
+    assert ramp_schedule(4, 8) == [0.0, 2.0, 4.0, 6.0]
+    assert ramp_schedule(4, 10, steps=2) == [0.0, 0.0, 5.0, 5.0]
+    assert ramp_schedule(0, 10) == []
+
+
+def test_percentile_nearest_rank():
+    values = range(1, 101)
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    assert percentile([7], 90) == 7
+    assert percentile([], 50) is None
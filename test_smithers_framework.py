@@ -0,0 +1,130 @@
+from smithers_framework import _MessageQueue
+from monty_random import RandomBot
+
+
+def message(m_type, name=None, **fields):
+    msg = {"type": m_type}
+    if name is not None:
+        msg["name"] = name
+    msg.update(fields)
+    return msg
+
+
+def drain(queue):
+    return [queue.get() for _ in xrange(queue.stats()["depth"])]
+
+
+def test_later_board_coalesces_earlier():
+    queue = _MessageQueue(8, "me")
+    queue.put(message("DEALT_BOARD", board=["Ah", "2c", "7d"]))
+    queue.put(message("DEALT_BOARD", board=["Ah", "2c", "7d", "9s"]))
+    assert drain(queue) == [message("DEALT_BOARD", board=["Ah", "2c", "7d", "9s"])]
+    assert queue.stats()["coalesced"] == 1
+
+
+def test_our_move_coalesces_our_move_request():
+    queue = _MessageQueue(8, "me")
+    queue.put(message("MOVE_REQUEST", "me"))
+    queue.put(message("MOVE_REQUEST", "them"))
+    queue.put(message("MOVE", "me", move="CALL"))
+    assert drain(queue) == [message("MOVE_REQUEST", "them"), message("MOVE", "me", move="CALL")]
+
+
+def test_new_hand_coalesces_last_hand():
+    queue = _MessageQueue(8, "me")
+    queue.put(message("DEALT_BOARD"))
+    queue.put(message("MOVE", "them", move="FOLD"))
+    queue.put(message("MOVE_REQUEST", "me"))
+    queue.put(message("RESULTS"))
+    queue.put(message("DEALT_HANDS"))
+    assert [m["type"] for m in drain(queue)] == ["MOVE", "RESULTS", "DEALT_HANDS"]
+    assert queue.stats()["coalesced"] == 2
+
+
+def test_full_queue_drops_other_players_move_requests_first():
+    queue = _MessageQueue(2, "me")
+    queue.put(message("MOVE_REQUEST", "them"))
+    queue.put(message("MOVE", "them", move="FOLD"))
+    queue.put(message("BLIND", "other", move="BLIND"))
+    assert [m["type"] for m in drain(queue)] == ["MOVE", "BLIND"]
+    assert queue.stats()["dropped"] == 1
+
+
+def test_full_queue_drops_incoming_non_essential():
+    queue = _MessageQueue(1, "me")
+    queue.put(message("DEALT_HANDS"))
+    queue.put(message("MOVE_REQUEST", "them"))
+    assert [m["type"] for m in drain(queue)] == ["DEALT_HANDS"]
+    assert queue.stats()["dropped"] == 1
+    assert queue.stats()["overflowed"] == 0
+
+
+def test_essential_messages_overflow_instead_of_dropping():
+    queue = _MessageQueue(1, "me")
+    moves = [message("MOVE", "p%d" % i, move="FOLD", chips_left=i) for i in xrange(3)]
+    for msg in moves:
+        queue.put(msg)
+    assert drain(queue) == moves
+    stats = queue.stats()
+    assert (stats["dropped"], stats["overflowed"], stats["max_depth"]) == (0, 2, 3)
+
+
+def test_exceptions_are_kept():
+    queue = _MessageQueue(1, "me")
+    error = IOError("socket closed")
+    queue.put(message("MOVE_REQUEST", "them"))
+    queue.put(error)
+    queue.put(message("RESULTS"))
+    assert drain(queue) == [error, message("RESULTS")]
+
+
+def test_stats_counters():
+    queue = _MessageQueue(4, "me")
+    queue.record_ping()
+    queue.record_ping()
+    queue.put(message("DEALT_HANDS"))
+    queue.put(message("DEALT_BOARD"))
+    queue.put(message("DEALT_BOARD"))
+    queue.get()
+    assert queue.stats() == {"received": 3, "pings": 2, "dropped": 0, "coalesced": 1,
+                             "overflowed": 0, "max_depth": 2, "depth": 1}
+
+
+class QuietBot(RandomBot):
+    """RandomBot that records what it would send and verify."""
+
+    def __init__(self):
+        super(QuietBot, self).__init__("me", "http://localhost:6767")
+        self.sent = []
+        self.verified = []
+
+    def _send_message_to_server(self, server_url, json_msg):
+        self.sent.append(json_msg)
+
+    def verify_move(self, name, move, amount, chips_left, msg):
+        self.verified.append((move, amount))
+        super(QuietBot, self).verify_move(name, move, amount, chips_left, msg)
+
+
+def move_request(name):
+    return message("MOVE_REQUEST", name, call=20, pot=30, current_bet=0, chips=1000,
+                   **{"raise": 40})
+
+
+def test_our_move_is_verified_against_what_we_sent():
+    bot = QuietBot()
+    assert bot._handle_message(move_request("me"))
+    (move, amount), = [bot._last_move]
+    assert bot._handle_message(message("MOVE", "me", move=move, bet=amount, chips=1000))
+    assert bot.verified == [(move, amount)]
+    assert bot._last_move is None
+
+
+def test_server_move_after_coalesced_request_is_not_verified():
+    bot = QuietBot()
+    queue = _MessageQueue(8, "me")
+    queue.put(move_request("me"))
+    queue.put(message("MOVE", "me", move="FOLD", bet=0, chips=1000))
+    for msg in drain(queue):
+        assert bot._handle_message(msg)
+    assert bot.sent == [] and bot.verified == []